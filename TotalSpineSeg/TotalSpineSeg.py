@@ -1,6 +1,12 @@
+import importlib
+import importlib.metadata
+import importlib.util
 import logging
 import os
 import re
+import time
+import traceback
+import types
 import vtk
 import qt
 import slicer
@@ -9,6 +15,25 @@ from slicer.i18n import translate
 from slicer.ScriptedLoadableModule import *
 from slicer.util import VTKObservationMixin
 
+# TotalSpineSeg output label values and their standard segment names.
+# Read-only, as getTerminologyMapping hands the shared table out to callers.
+_TERMINOLOGY_MAPPING = types.MappingProxyType({
+    1: "spinal_cord", 2: "spinal_canal", 3: "vertebrae_L5", 
+    11: "vertebrae_C1", 12: "vertebrae_C2", 13: "vertebrae_C3", 14: "vertebrae_C4", 15: "vertebrae_C5", 16: "vertebrae_C6", 17: "vertebrae_C7",
+    21: "vertebrae_T1", 22: "vertebrae_T2", 23: "vertebrae_T3", 24: "vertebrae_T4", 25: "vertebrae_T5", 26: "vertebrae_T6", 27: "vertebrae_T7", 28: "vertebrae_T8", 29: "vertebrae_T9", 30: "vertebrae_T10", 31: "vertebrae_T11", 32: "vertebrae_T12",
+    41: "vertebrae_L1", 42: "vertebrae_L2", 43: "vertebrae_L3", 44: "vertebrae_L4", 45: "vertebrae_L5", 46: "vertebrae_L6",
+    50: "sacrum",
+    63: "disc_C2_C3", 64: "disc_C3_C4", 65: "disc_C4_C5", 66: "disc_C5_C6", 67: "disc_C6_C7", 70: "disc_C7_T1", 
+    71: "disc_T1_T2", 72: "disc_T2_T3", 73: "disc_T3_T4", 74: "disc_T4_T5", 75: "disc_T5_T6", 76: "disc_T6_T7", 77: "disc_T7_T8", 78: "disc_T8_T9", 79: "disc_T9_T10", 80: "disc_T10_T11", 81: "disc_T11_T12",
+    91: "disc_T12_L1", 92: "disc_L1_L2", 93: "disc_L2_L3", 94: "disc_L3_L4", 95: "disc_L4_L5", 100: "disc_L5_S1"
+})
+_TERMINOLOGY_REVERSE_MAPPING = types.MappingProxyType({name: labelValue for labelValue, name in _TERMINOLOGY_MAPPING.items()})
+
+_DIGITS_RE = re.compile(r'\d+')
+_NEWLINE_RE = re.compile(r'\r\n|\r|\n')
+_REQUIREMENT_NAME_RE = re.compile(r'[A-Za-z0-9][A-Za-z0-9._-]*')
+_EXTRA_MARKER_RE = re.compile(r'\bextra\s*==')
+
 class TotalSpineSeg(ScriptedLoadableModule):
     def __init__(self, parent):
         ScriptedLoadableModule.__init__(self, parent)
@@ -28,24 +53,60 @@ TotalSpineSeg: Robust Spine Segmentation with Landmark-Based Labeling in MRI. Re
 """)
 
 class TotalSpineSegWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
+    # Parameter node reference role of each node selector
+    _SELECTOR_ROLES = (
+        ("InputVolume", "inputVolumeSelector"), ("InputLocalizer", "inputLocalizerSelector"),
+        ("OutputStep1", "outputStep1Selector"), ("OutputStep2", "outputStep2Selector"),
+        ("OutputCord", "outputCordSelector"), ("OutputCanal", "outputCanalSelector"),
+        ("OutputLevels", "outputLevelsSelector"),
+    )
+
+    # Icons are loaded on first setup and shared by all widget instances
+    _eyeIcon = None
+    _eyeOffIcon = None
+    _threeDIcon = None
+
     def __init__(self, parent=None):
         ScriptedLoadableModuleWidget.__init__(self, parent)
         VTKObservationMixin.__init__(self)
         self.logic = None
         self._parameterNode = None
         self._updatingGUIFromParameterNode = False
+        self._guiUpdatePending = False
+        self._lastGUIState = {}
         
         self.installAnimationTimer = qt.QTimer()
         self.installAnimationTimer.setInterval(500)
         self.installAnimationTimer.connect('timeout()', self.onInstallAnimationTimer)
         self.installAnimationCounter = 0
+        self.installAnimationFrames = [f"Installing packages{'.' * i}" for i in range(4)]
+
+        # Log lines are buffered and shown at most once per interval to limit GUI refreshes
+        self.logFlushTimer = qt.QTimer()
+        self.logFlushTimer.setSingleShot(True)
+        self.logFlushInterval = 0.03
+        self.logFlushTimer.setInterval(int(self.logFlushInterval * 1000))
+        self.logFlushTimer.connect('timeout()', self.flushLog)
+        self.logBuffer = []
+        self.lastLogFlushTime = 0
+        # Pumping the event queue repaints every view, so flushes do it at most this often
+        self.processEventsInterval = 0.1
+        self.lastProcessEventsTime = 0
 
     def setup(self):
         ScriptedLoadableModuleWidget.setup(self)
         uiWidget = slicer.util.loadUI(self.resourcePath('UI/TotalSpineSeg.ui'))
         self.layout.addWidget(uiWidget)
         self.ui = slicer.util.childWidgetVariables(uiWidget)
+        ui = self.ui
         uiWidget.setMRMLScene(slicer.mrmlScene)
+        # Translated once, used by every load-from-file button
+        self.loadFileDialogTitle = _("Load File")
+        self.loadFileDialogFilter = _("Medical Images (*.nii.gz *.nii *.nrrd *.seg.nrrd);;All Files (*)")
+        # Resolved once, the inputs section is shown or hidden on every dependency check
+        self.inputsCollapsibleButton = getattr(ui, 'inputsCollapsibleButton', None)
+        # Node selectors in parameter role order, shared by the loops that treat them all alike
+        self.allSelectors = tuple(getattr(ui, selectorName) for role, selectorName in self._SELECTOR_ROLES)
 
         # Create Install Widget (initially hidden)
         self.installWidget = qt.QWidget()
@@ -66,7 +127,7 @@ class TotalSpineSegWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         # Insert installWidget into the main UI layout before the statusLabel (output box)
         # This ensures it appears above the output box but below the tab widget (which is hidden when installing)
         uiLayout = uiWidget.layout()
-        statusLabelIndex = uiLayout.indexOf(self.ui.statusLabel)
+        statusLabelIndex = uiLayout.indexOf(ui.statusLabel)
         if statusLabelIndex != -1:
             uiLayout.insertWidget(statusLabelIndex, self.installWidget)
         else:
@@ -81,102 +142,93 @@ class TotalSpineSegWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
 
         # Setup Icons
         # Try to load standard icons from Slicer resources. If they fail, fallback to text.
-        self.eyeIcon = qt.QIcon(":/Icons/VisibleOn.png")
-        self.eyeOffIcon = qt.QIcon(":/Icons/VisibleOff.png")
-        threeDIcon = qt.QIcon(":/Icons/MakeModel.png")
-
-        for btn in [self.ui.visibleInputButton, self.ui.visibleLocalizerButton, self.ui.visibleStep2Button, self.ui.visibleStep1Button, self.ui.visibleLevelsButton, self.ui.visibleCordButton, self.ui.visibleCanalButton]:
-            btn.setIcon(self.eyeIcon)
-            if self.eyeIcon.isNull():
-                btn.setText("👁")
-            else:
-                btn.setText("")
-            btn.setToolTip(_("Show/Hide"))
-            btn.setFixedSize(24, 24)
-
-        for btn in [self.ui.show3DInputButton, self.ui.show3DLocalizerButton, self.ui.show3DStep2Button, self.ui.show3DStep1Button, self.ui.show3DLevelsButton, self.ui.show3DCordButton, self.ui.show3DCanalButton]:
-            btn.setIcon(threeDIcon)
-            if threeDIcon.isNull():
-                btn.setText("3D")
-            else:
-                btn.setText("")
-            btn.setToolTip(_("Show/Hide 3D"))
-            btn.setFixedSize(24, 24)
-
-        # Setup Load Buttons
-        for btn in [self.ui.loadStep2FileButton, self.ui.loadStep1FileButton, self.ui.loadLevelsFileButton, self.ui.loadCordFileButton, self.ui.loadCanalFileButton, self.ui.inputVolumeFileButton, self.ui.inputLocalizerFileButton]:
-            btn.setIcon(qt.QIcon())
-            btn.setText("...")
-            btn.setToolTip(_("Load from file"))
-            btn.setFixedSize(24, 24)
+        cls = TotalSpineSegWidget
+        if cls._eyeIcon is None:
+            cls._eyeIcon = qt.QIcon(":/Icons/VisibleOn.png")
+            cls._eyeOffIcon = qt.QIcon(":/Icons/VisibleOff.png")
+            cls._threeDIcon = qt.QIcon(":/Icons/MakeModel.png")
+        self.eyeIcon = cls._eyeIcon
+        self.eyeOffIcon = cls._eyeOffIcon
+        threeDIcon = cls._threeDIcon
+        # Whether an icon resource is missing does not change at runtime
+        self.eyeIconIsNull = self.eyeIcon.isNull()
+        self.eyeOffIconIsNull = self.eyeOffIcon.isNull()
+
+        # Icon, text fallback and tooltip of each button group; load buttons always show text
+        for buttons, icon, fallbackText, toolTip in [
+                ([ui.visibleInputButton, ui.visibleLocalizerButton, ui.visibleStep2Button, ui.visibleStep1Button, ui.visibleLevelsButton, ui.visibleCordButton, ui.visibleCanalButton],
+                 self.eyeIcon, "👁", _("Show/Hide")),
+                ([ui.show3DInputButton, ui.show3DLocalizerButton, ui.show3DStep2Button, ui.show3DStep1Button, ui.show3DLevelsButton, ui.show3DCordButton, ui.show3DCanalButton],
+                 threeDIcon, "3D", _("Show/Hide 3D")),
+                ([ui.loadStep2FileButton, ui.loadStep1FileButton, ui.loadLevelsFileButton, ui.loadCordFileButton, ui.loadCanalFileButton, ui.inputVolumeFileButton, ui.inputLocalizerFileButton],
+                 qt.QIcon(), "...", _("Load from file"))]:
+            text = fallbackText if icon.isNull() else ""
+            for btn in buttons:
+                btn.setIcon(icon)
+                btn.setText(text)
+                btn.setToolTip(toolTip)
+                btn.setFixedSize(24, 24)
 
         # Fix Width Issues
-        for combo in [self.ui.inputVolumeSelector, self.ui.inputLocalizerSelector, self.ui.outputStep1Selector, self.ui.outputStep2Selector, 
-                      self.ui.outputCordSelector, self.ui.outputCanalSelector, self.ui.outputLevelsSelector]:
+        for combo in self.allSelectors:
             combo.setSizePolicy(qt.QSizePolicy.Ignored, qt.QSizePolicy.Fixed)
         
+        # How a file loaded through each selector's button is read and shown
+        self.loadFileRoles = {
+            ui.outputStep1Selector: "segmentation",
+            ui.outputStep2Selector: "segmentation",
+            ui.outputLevelsSelector: "segmentation",
+            ui.inputLocalizerSelector: "segmentation",
+            ui.outputCordSelector: "foreground",
+            ui.outputCanalSelector: "foreground",
+            ui.inputVolumeSelector: "background",
+        }
+        
         # Ensure localizer selector is enabled and configured
-        self.ui.inputLocalizerSelector.enabled = True
-        self.ui.inputLocalizerSelector.noneEnabled = True
-        self.ui.inputLocalizerSelector.addEnabled = False
-        self.ui.inputLocalizerSelector.removeEnabled = False
-        self.ui.inputLocalizerSelector.renameEnabled = False
-        self.ui.inputLocalizerSelector.editEnabled = False
-        self.ui.inputLocalizerSelector.setMRMLScene(slicer.mrmlScene)
+        ui.inputLocalizerSelector.enabled = True
+        ui.inputLocalizerSelector.noneEnabled = True
+        ui.inputLocalizerSelector.addEnabled = False
+        ui.inputLocalizerSelector.removeEnabled = False
+        ui.inputLocalizerSelector.renameEnabled = False
+        ui.inputLocalizerSelector.editEnabled = False
+        ui.inputLocalizerSelector.setMRMLScene(slicer.mrmlScene)
 
         self.addObserver(slicer.mrmlScene, slicer.mrmlScene.StartCloseEvent, self.onSceneStartClose)
         self.addObserver(slicer.mrmlScene, slicer.mrmlScene.EndCloseEvent, self.onSceneEndClose)
 
-        self.ui.inputVolumeSelector.connect("currentNodeChanged(vtkMRMLNode*)", self.updateParameterNodeFromGUI)
-        self.ui.inputLocalizerSelector.connect("currentNodeChanged(vtkMRMLNode*)", self.updateParameterNodeFromGUI)
-        self.ui.outputStep1Selector.connect("currentNodeChanged(vtkMRMLNode*)", self.updateParameterNodeFromGUI)
-        self.ui.outputStep2Selector.connect("currentNodeChanged(vtkMRMLNode*)", self.updateParameterNodeFromGUI)
-        self.ui.outputCordSelector.connect("currentNodeChanged(vtkMRMLNode*)", self.updateParameterNodeFromGUI)
-        self.ui.outputCanalSelector.connect("currentNodeChanged(vtkMRMLNode*)", self.updateParameterNodeFromGUI)
-        self.ui.outputLevelsSelector.connect("currentNodeChanged(vtkMRMLNode*)", self.updateParameterNodeFromGUI)
+        # Each widget only writes its own parameter, so a change does not re-serialize all the others
+        for (role, selectorName), selector in zip(self._SELECTOR_ROLES, self.allSelectors):
+            selector.connect("currentNodeChanged(vtkMRMLNode*)", lambda n, role=role: self.updateParameterNodeReferenceFromGUI(role, n))
         
-        self.ui.cpuCheckBox.connect('toggled(bool)', self.updateParameterNodeFromGUI)
-        self.ui.applyTerminologyCheckBox.connect('toggled(bool)', self.onApplyTerminologyToggled)
-        self.ui.isoCheckBox.connect('toggled(bool)', self.updateParameterNodeFromGUI)
+        ui.cpuCheckBox.connect('toggled(bool)', lambda checked: self.updateParameterFromGUI("CPU", checked))
+        ui.applyTerminologyCheckBox.connect('toggled(bool)', self.onApplyTerminologyToggled)
+        ui.isoCheckBox.connect('toggled(bool)', lambda checked: self.updateParameterFromGUI("Iso", checked))
 
-        self.ui.applyButton.connect('clicked(bool)', self.onApplyButton)
-        self.ui.packageInfoUpdateButton.connect('clicked(bool)', self.onPackageInfoUpdate)
-        self.ui.packageUpgradeButton.connect('clicked(bool)', self.onPackageUpgrade)
+        ui.applyButton.connect('clicked(bool)', self.onApplyButton)
+        ui.packageInfoUpdateButton.connect('clicked(bool)', self.onPackageInfoUpdate)
+        ui.packageUpgradeButton.connect('clicked(bool)', self.onPackageUpgrade)
 
         # Apply styles when selected
-        self.ui.outputCordSelector.connect("currentNodeChanged(vtkMRMLNode*)", self.onLoadCordChanged)
-        self.ui.outputCanalSelector.connect("currentNodeChanged(vtkMRMLNode*)", self.onLoadCanalChanged)
+        ui.outputCordSelector.connect("currentNodeChanged(vtkMRMLNode*)", self.onLoadCordChanged)
+        ui.outputCanalSelector.connect("currentNodeChanged(vtkMRMLNode*)", self.onLoadCanalChanged)
         
         # Connect output selectors to handle terminology application on selection change
-        self.ui.outputStep1Selector.connect("currentNodeChanged(vtkMRMLNode*)", lambda n: self.onOutputNodeChanged(n, self.ui.outputStep1Selector))
-        self.ui.outputStep2Selector.connect("currentNodeChanged(vtkMRMLNode*)", lambda n: self.onOutputNodeChanged(n, self.ui.outputStep2Selector))
-        self.ui.outputLevelsSelector.connect("currentNodeChanged(vtkMRMLNode*)", lambda n: self.onOutputNodeChanged(n, self.ui.outputLevelsSelector))
-
-        self.ui.visibleInputButton.connect('clicked(bool)', lambda b: self.onVisibilityToggled(self.ui.visibleInputButton, self.ui.inputVolumeSelector.currentNode()))
-        self.ui.visibleLocalizerButton.connect('clicked(bool)', lambda b: self.onVisibilityToggled(self.ui.visibleLocalizerButton, self.ui.inputLocalizerSelector.currentNode()))
-        self.ui.visibleStep2Button.connect('clicked(bool)', lambda b: self.onVisibilityToggled(self.ui.visibleStep2Button, self.ui.outputStep2Selector.currentNode()))
-        self.ui.visibleStep1Button.connect('clicked(bool)', lambda b: self.onVisibilityToggled(self.ui.visibleStep1Button, self.ui.outputStep1Selector.currentNode()))
-        self.ui.visibleLevelsButton.connect('clicked(bool)', lambda b: self.onVisibilityToggled(self.ui.visibleLevelsButton, self.ui.outputLevelsSelector.currentNode()))
-        self.ui.visibleCordButton.connect('clicked(bool)', lambda b: self.onVisibilityToggled(self.ui.visibleCordButton, self.ui.outputCordSelector.currentNode()))
-        self.ui.visibleCanalButton.connect('clicked(bool)', lambda b: self.onVisibilityToggled(self.ui.visibleCanalButton, self.ui.outputCanalSelector.currentNode()))
-
-        self.ui.show3DInputButton.connect('clicked(bool)', lambda b: self.on3DToggled(self.ui.inputVolumeSelector.currentNode()))
-        self.ui.show3DLocalizerButton.connect('clicked(bool)', lambda b: self.on3DToggled(self.ui.inputLocalizerSelector.currentNode()))
-        self.ui.show3DStep2Button.connect('clicked(bool)', lambda b: self.on3DToggled(self.ui.outputStep2Selector.currentNode()))
-        self.ui.show3DStep1Button.connect('clicked(bool)', lambda b: self.on3DToggled(self.ui.outputStep1Selector.currentNode()))
-        self.ui.show3DLevelsButton.connect('clicked(bool)', lambda b: self.on3DToggled(self.ui.outputLevelsSelector.currentNode()))
-        self.ui.show3DCordButton.connect('clicked(bool)', lambda b: self.on3DToggled(self.ui.outputCordSelector.currentNode()))
-        self.ui.show3DCanalButton.connect('clicked(bool)', lambda b: self.on3DToggled(self.ui.outputCanalSelector.currentNode()))
-
-        self.ui.inputVolumeFileButton.connect('clicked(bool)', lambda b: self.onLoadFile(self.ui.inputVolumeSelector))
-        self.ui.inputLocalizerFileButton.connect('clicked(bool)', lambda b: self.onLoadFile(self.ui.inputLocalizerSelector))
-        
-        # The new file buttons in outputs section
-        self.ui.loadStep2FileButton.connect('clicked(bool)', lambda b: self.onLoadFile(self.ui.outputStep2Selector))
-        self.ui.loadStep1FileButton.connect('clicked(bool)', lambda b: self.onLoadFile(self.ui.outputStep1Selector))
-        self.ui.loadLevelsFileButton.connect('clicked(bool)', lambda b: self.onLoadFile(self.ui.outputLevelsSelector))
-        self.ui.loadCordFileButton.connect('clicked(bool)', lambda b: self.onLoadFile(self.ui.outputCordSelector))
-        self.ui.loadCanalFileButton.connect('clicked(bool)', lambda b: self.onLoadFile(self.ui.outputCanalSelector))
+        ui.outputStep1Selector.connect("currentNodeChanged(vtkMRMLNode*)", lambda n: self.onOutputNodeChanged(n, ui.outputStep1Selector))
+        ui.outputStep2Selector.connect("currentNodeChanged(vtkMRMLNode*)", lambda n: self.onOutputNodeChanged(n, ui.outputStep2Selector))
+        ui.outputLevelsSelector.connect("currentNodeChanged(vtkMRMLNode*)", lambda n: self.onOutputNodeChanged(n, ui.outputLevelsSelector))
+
+        # Visibility, 3D and load-from-file buttons act on the node of the selector in the same row
+        for selector, visibleButton, show3DButton, loadFileButton in [
+                (ui.inputVolumeSelector, ui.visibleInputButton, ui.show3DInputButton, ui.inputVolumeFileButton),
+                (ui.inputLocalizerSelector, ui.visibleLocalizerButton, ui.show3DLocalizerButton, ui.inputLocalizerFileButton),
+                (ui.outputStep2Selector, ui.visibleStep2Button, ui.show3DStep2Button, ui.loadStep2FileButton),
+                (ui.outputStep1Selector, ui.visibleStep1Button, ui.show3DStep1Button, ui.loadStep1FileButton),
+                (ui.outputLevelsSelector, ui.visibleLevelsButton, ui.show3DLevelsButton, ui.loadLevelsFileButton),
+                (ui.outputCordSelector, ui.visibleCordButton, ui.show3DCordButton, ui.loadCordFileButton),
+                (ui.outputCanalSelector, ui.visibleCanalButton, ui.show3DCanalButton, ui.loadCanalFileButton)]:
+            visibleButton.connect('clicked(bool)', lambda b, button=visibleButton, selector=selector: self.onVisibilityToggled(button, selector.currentNode()))
+            show3DButton.connect('clicked(bool)', lambda b, selector=selector: self.on3DToggled(selector.currentNode()))
+            loadFileButton.connect('clicked(bool)', lambda b, selector=selector: self.onLoadFile(selector))
 
         self.initializeParameterNode()
         self.onSelect()
@@ -188,38 +240,45 @@ class TotalSpineSegWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
     def cleanup(self):
         self.removeObservers()
         self.installAnimationTimer.stop()
+        self.logFlushTimer.stop()
 
     def enter(self):
         self.initializeParameterNode()
         self.checkDependenciesAndToggleUI()
 
-    def checkDependenciesAndToggleUI(self):
+    def checkDependenciesWithWaitCursor(self):
+        # Only show the wait cursor if the check will actually probe the installation
+        if self.logic.dependenciesChecked():
+            return self.logic.checkDependencies()
+        slicer.app.setOverrideCursor(qt.Qt.WaitCursor)
         try:
-            slicer.app.setOverrideCursor(qt.Qt.WaitCursor)
-            missingPackages = self.logic.checkDependencies()
+            return self.logic.checkDependencies()
+        finally:
             slicer.app.restoreOverrideCursor()
+
+    def checkDependenciesAndToggleUI(self):
+        try:
+            missingPackages = self.checkDependenciesWithWaitCursor()
         except Exception as e:
-            slicer.app.restoreOverrideCursor()
-            import traceback
             traceback.print_exc()
             missingPackages = [] # Assume installed or handle error? 
             # If check fails, better to show error.
             self.installLabel.setText(f"Error checking dependencies:\n{str(e)}")
-            if hasattr(self.ui, 'inputsCollapsibleButton'):
-                 self.ui.inputsCollapsibleButton.hide()
+            if self.inputsCollapsibleButton is not None:
+                 self.inputsCollapsibleButton.hide()
             self.installWidget.show()
             return
 
         if missingPackages:
-            if hasattr(self.ui, 'inputsCollapsibleButton'):
-                 self.ui.inputsCollapsibleButton.hide()
+            if self.inputsCollapsibleButton is not None:
+                 self.inputsCollapsibleButton.hide()
             self.installWidget.show()
             self.installLabel.setText(f"The following packages are missing:\n{', '.join(missingPackages)}\n\nPlease install them to use this module.")
             self.installButton.show()
         else:
             self.installWidget.hide()
-            if hasattr(self.ui, 'inputsCollapsibleButton'):
-                 self.ui.inputsCollapsibleButton.show()
+            if self.inputsCollapsibleButton is not None:
+                 self.inputsCollapsibleButton.show()
 
     def onInstallButton(self):
         missingPackages = self.logic.checkDependencies()
@@ -246,7 +305,6 @@ class TotalSpineSegWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
                 return 
             
             # If no restart needed, re-check and show UI
-            import importlib
             importlib.invalidate_caches()
             
             # Double check if packages are still missing
@@ -266,18 +324,16 @@ class TotalSpineSegWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
             self.installAnimationTimer.stop()
             self.installStatusLabel.setText(f"Installation failed: {str(e)}")
             self.installButton.enabled = True
-            import traceback
             traceback.print_exc()
 
     def exit(self):
         if self._parameterNode:
-            self.removeObserver(self._parameterNode, vtk.vtkCommand.ModifiedEvent, self.updateGUIFromParameterNode)
+            self.removeObserver(self._parameterNode, vtk.vtkCommand.ModifiedEvent, self.onParameterNodeModified)
 
     def onSceneStartClose(self, caller, event):
         self.setParameterNode(None)
         # Explicitly clear selectors to prevent Subject Hierarchy warnings during close
-        for selector in [self.ui.inputVolumeSelector, self.ui.inputLocalizerSelector, self.ui.outputStep1Selector, self.ui.outputStep2Selector, 
-                         self.ui.outputCordSelector, self.ui.outputCanalSelector, self.ui.outputLevelsSelector]:
+        for selector in self.allSelectors:
             selector.setCurrentNode(None)
 
     def onSceneEndClose(self, caller, event):
@@ -295,10 +351,22 @@ class TotalSpineSegWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         if inputParameterNode:
             self.logic.setDefaultParameters(inputParameterNode)
         if self._parameterNode is not None:
-            self.removeObserver(self._parameterNode, vtk.vtkCommand.ModifiedEvent, self.updateGUIFromParameterNode)
+            self.removeObserver(self._parameterNode, vtk.vtkCommand.ModifiedEvent, self.onParameterNodeModified)
         self._parameterNode = inputParameterNode
+        self._lastGUIState = {}
         if self._parameterNode is not None:
-            self.addObserver(self._parameterNode, vtk.vtkCommand.ModifiedEvent, self.updateGUIFromParameterNode)
+            self.addObserver(self._parameterNode, vtk.vtkCommand.ModifiedEvent, self.onParameterNodeModified)
+        self.updateGUIFromParameterNode()
+
+    def onParameterNodeModified(self, caller=None, event=None):
+        # Coalesce all modifications made in one event loop iteration into a single GUI update
+        if self._guiUpdatePending:
+            return
+        self._guiUpdatePending = True
+        qt.QTimer.singleShot(0, self.onDeferredGUIUpdate)
+
+    def onDeferredGUIUpdate(self):
+        self._guiUpdatePending = False
         self.updateGUIFromParameterNode()
 
     def updateGUIFromParameterNode(self, caller=None, event=None):
@@ -306,84 +374,87 @@ class TotalSpineSegWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
             return
         self._updatingGUIFromParameterNode = True
 
-        self.ui.inputVolumeSelector.setCurrentNode(self._parameterNode.GetNodeReference("InputVolume"))
-        self.ui.inputLocalizerSelector.setCurrentNode(self._parameterNode.GetNodeReference("InputLocalizer"))
-        self.ui.outputStep1Selector.setCurrentNode(self._parameterNode.GetNodeReference("OutputStep1"))
-        self.ui.outputStep2Selector.setCurrentNode(self._parameterNode.GetNodeReference("OutputStep2"))
-        self.ui.outputCordSelector.setCurrentNode(self._parameterNode.GetNodeReference("OutputCord"))
-        self.ui.outputCanalSelector.setCurrentNode(self._parameterNode.GetNodeReference("OutputCanal"))
-        self.ui.outputLevelsSelector.setCurrentNode(self._parameterNode.GetNodeReference("OutputLevels"))
-        
-        self.ui.cpuCheckBox.checked = self._parameterNode.GetParameter("CPU") == "true"
-        self.ui.applyTerminologyCheckBox.checked = self._parameterNode.GetParameter("UseStandardSegmentNames") == "true"
-        self.ui.isoCheckBox.checked = self._parameterNode.GetParameter("Iso") == "true"
+        ui = self.ui
+        getNodeReferenceID = self._parameterNode.GetNodeReferenceID
+        getParameter = self._parameterNode.GetParameter
+
+        # Only push values that changed since the last update, rewriting every widget emits needless signals
+        for (role, selectorName), selector in zip(self._SELECTOR_ROLES, self.allSelectors):
+            nodeID = getNodeReferenceID(role)
+            if role in self._lastGUIState and self._lastGUIState[role] == nodeID:
+                continue
+            selector.setCurrentNode(self._parameterNode.GetNodeReference(role))
+            self._lastGUIState[role] = nodeID
+
+        for name, checkBox in [("CPU", ui.cpuCheckBox), ("UseStandardSegmentNames", ui.applyTerminologyCheckBox), ("Iso", ui.isoCheckBox)]:
+            value = getParameter(name)
+            if name in self._lastGUIState and self._lastGUIState[name] == value:
+                continue
+            checkBox.checked = value == "true"
+            self._lastGUIState[name] = value
 
         self.updateAllButtonsState()
         self.onSelect()
         self._updatingGUIFromParameterNode = False
 
-    def updateParameterNodeFromGUI(self, caller=None, event=None):
+    def updateParameterNodeReferenceFromGUI(self, role, node):
         if self._parameterNode is None or self._updatingGUIFromParameterNode:
             return
-        
-        wasModified = self._parameterNode.StartModify()
-        
-        self._parameterNode.SetNodeReferenceID("InputVolume", self.ui.inputVolumeSelector.currentNodeID)
-        self._parameterNode.SetNodeReferenceID("InputLocalizer", self.ui.inputLocalizerSelector.currentNodeID)
-        self._parameterNode.SetNodeReferenceID("OutputStep1", self.ui.outputStep1Selector.currentNodeID)
-        self._parameterNode.SetNodeReferenceID("OutputStep2", self.ui.outputStep2Selector.currentNodeID)
-        self._parameterNode.SetNodeReferenceID("OutputCord", self.ui.outputCordSelector.currentNodeID)
-        self._parameterNode.SetNodeReferenceID("OutputCanal", self.ui.outputCanalSelector.currentNodeID)
-        self._parameterNode.SetNodeReferenceID("OutputLevels", self.ui.outputLevelsSelector.currentNodeID)
-        
-        self._parameterNode.SetParameter("CPU", "true" if self.ui.cpuCheckBox.checked else "false")
-        self._parameterNode.SetParameter("UseStandardSegmentNames", "true" if self.ui.applyTerminologyCheckBox.checked else "false")
-        self._parameterNode.SetParameter("Iso", "true" if self.ui.isoCheckBox.checked else "false")
+        self._parameterNode.SetNodeReferenceID(role, node.GetID() if node else None)
 
-        self._parameterNode.EndModify(wasModified)
+    def updateParameterFromGUI(self, name, checked):
+        if self._parameterNode is None or self._updatingGUIFromParameterNode:
+            return
+        self._parameterNode.SetParameter(name, "true" if checked else "false")
 
     def onSelect(self):
         self.ui.applyButton.enabled = self.ui.inputVolumeSelector.currentNode() is not None
 
     def onLoadFile(self, selector):
+        # Start in the folder of the last loaded file instead of making the dialog list the default location
+        settings = slicer.app.userSettings()
+        lastDirectory = settings.value("TotalSpineSeg/LastLoadDirectory", "")
         file_path = qt.QFileDialog.getOpenFileName(
             self.parent.parent(), 
-            _("Load File"), 
-            "", 
-            _("Medical Images (*.nii.gz *.nii *.nrrd *.seg.nrrd);;All Files (*)")
+            self.loadFileDialogTitle, 
+            lastDirectory, 
+            self.loadFileDialogFilter
         )
         if not file_path:
             return
+        settings.setValue("TotalSpineSeg/LastLoadDirectory", os.path.dirname(file_path))
 
         # Determine intended type based on selector
-        isSegmentation = selector in [self.ui.outputStep1Selector, self.ui.outputStep2Selector, self.ui.outputLevelsSelector, self.ui.inputLocalizerSelector]
-        isCord = selector == self.ui.outputCordSelector
-        isCanal = selector == self.ui.outputCanalSelector
+        loadRole = self.loadFileRoles.get(selector)
         
-        if isSegmentation:
-            # Load as labelmap, convert to segmentation
-            labelNode = slicer.util.loadLabelVolume(file_path, {"show": False})
-            if labelNode:
-                segNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLSegmentationNode")
-                segNode.SetName(os.path.splitext(os.path.basename(file_path))[0])
-                slicer.modules.segmentations.logic().ImportLabelmapToSegmentationNode(labelNode, segNode)
-                slicer.mrmlScene.RemoveNode(labelNode)
-                
+        if loadRole == "segmentation":
+            segNode = None
+            if file_path.lower().endswith(".seg.nrrd"):
+                # Segmentation files are read directly, without a temporary labelmap node
+                segNode = slicer.util.loadSegmentation(file_path, {"show": False})
+            else:
+                # Load as labelmap, convert to segmentation
+                labelNode = slicer.util.loadLabelVolume(file_path, {"show": False})
+                if labelNode:
+                    segNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLSegmentationNode")
+                    segNode.SetName(os.path.splitext(os.path.basename(file_path))[0])
+                    slicer.modules.segmentations.logic().ImportLabelmapToSegmentationNode(labelNode, segNode)
+                    slicer.mrmlScene.RemoveNode(labelNode)
+            if segNode:
                 # Apply terminology if checked, but exclude Localizer (should keep original labels usually)
                 if self.ui.applyTerminologyCheckBox.checked and selector != self.ui.inputLocalizerSelector:
                     renameSacrum = (selector == self.ui.outputStep1Selector)
                     self.logic.applyTotalSpineSegTerminology(segNode, renameSacrumToVertebrae=renameSacrum)
                 
                 segNode.CreateDefaultDisplayNodes()
-                slicer.app.processEvents()
                 selector.setCurrentNodeID(segNode.GetID())
-        elif isCord or isCanal:
+        elif loadRole == "foreground":
              # Load as volume, hidden initially to avoid replacing background
             volNode = slicer.util.loadVolume(file_path, {"show": False})
             if volNode:
                 selector.setCurrentNode(volNode)
                 # Note: onLoadCordChanged/onLoadCanalChanged will trigger and apply style/foreground
-        elif selector == self.ui.inputVolumeSelector:
+        elif loadRole == "background":
              # Load as background
             volNode = slicer.util.loadVolume(file_path, {"show": True})
             if volNode:
@@ -400,14 +471,14 @@ class TotalSpineSegWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
 
     def onInstallAnimationTimer(self):
         self.installAnimationCounter = (self.installAnimationCounter + 1) % 4
-        dots = "." * self.installAnimationCounter
-        text = f"Installing packages{dots}"
+        text = self.installAnimationFrames[self.installAnimationCounter]
         if self.installWidget.isVisible():
             self.installStatusLabel.setText(text)
         else:
             self.ui.statusLabel.plainText = text
 
     def onApplyButton(self):
+        self.flushLog()
         self.ui.statusLabel.plainText = ''
         
         if not self.ui.outputStep1Selector.currentNode():
@@ -415,12 +486,8 @@ class TotalSpineSegWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         
         # Check dependencies (failsafe)
         try:
-            slicer.app.setOverrideCursor(qt.Qt.WaitCursor)
-            missingPackages = self.logic.checkDependencies()
-            slicer.app.restoreOverrideCursor()
+            missingPackages = self.checkDependenciesWithWaitCursor()
         except Exception as e:
-            slicer.app.restoreOverrideCursor()
-            import traceback
             traceback.print_exc()
             self.ui.statusLabel.plainText = f"Failed to check dependencies:\n{str(e)}"
             return
@@ -453,7 +520,6 @@ class TotalSpineSegWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
             except Exception as e:
                 self.installAnimationTimer.stop()
                 self.ui.statusLabel.plainText = f"Installation failed: {str(e)}"
-                import traceback
                 traceback.print_exc()
                 return
 
@@ -476,12 +542,13 @@ class TotalSpineSegWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
                 waitForCompletion=False
             )
         except Exception as e:
+            self.flushLog()
             self.ui.applyButton.enabled = True
             self.ui.statusLabel.plainText = f"Processing failed: {str(e)}"
-            import traceback
             traceback.print_exc()
 
     def onProcessingFinished(self, success):
+        self.flushLog()
         self.ui.applyButton.enabled = True
         if success:
             self.ui.statusLabel.appendPlainText("\n" + _("Processing finished."))
@@ -552,11 +619,15 @@ class TotalSpineSegWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
             displayNode.SetLowerThreshold(0.5)
             displayNode.SetAndObserveColorNodeID(colorNodeID)
             
-            # Set as Foreground
-            slicer.util.setSliceViewerLayers(foreground=node, foregroundOpacity=1.0)
+            # Set as Foreground, unless every slice view already shows it there (avoids re-rendering all views)
+            nodeID = node.GetID()
+            for compositeNode in slicer.util.getNodesByClass("vtkMRMLSliceCompositeNode"):
+                if compositeNode.GetForegroundVolumeID() != nodeID or compositeNode.GetForegroundOpacity() != 1.0:
+                    slicer.util.setSliceViewerLayers(foreground=node, foregroundOpacity=1.0)
+                    break
             
     def onApplyTerminologyToggled(self, checked):
-        self.updateParameterNodeFromGUI()
+        self.updateParameterFromGUI("UseStandardSegmentNames", checked)
         if checked:
             for selector in [self.ui.outputStep1Selector, self.ui.outputStep2Selector, self.ui.outputLevelsSelector]:
                 node = selector.currentNode()
@@ -662,13 +733,13 @@ class TotalSpineSegWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         # Update Eye Button
         eyeBtn.setChecked(isVisible)
         if isVisible:
-            if not self.eyeIcon.isNull():
+            if not self.eyeIconIsNull:
                 eyeBtn.setIcon(self.eyeIcon)
                 eyeBtn.setText("")
             else:
                 eyeBtn.setText("👁")
         else:
-            if not self.eyeOffIcon.isNull():
+            if not self.eyeOffIconIsNull:
                 eyeBtn.setIcon(self.eyeOffIcon)
                 eyeBtn.setText("")
             else:
@@ -701,8 +772,22 @@ class TotalSpineSegWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
             slicer.util.restart()
 
     def addLog(self, text):
-        self.ui.statusLabel.appendPlainText(text)
-        slicer.app.processEvents()
+        self.logBuffer.append(text)
+        if time.monotonic() - self.lastLogFlushTime >= self.logFlushInterval:
+            self.flushLog()
+        elif not self.logFlushTimer.isActive():
+            self.logFlushTimer.start()
+
+    def flushLog(self):
+        self.logFlushTimer.stop()
+        self.lastLogFlushTime = time.monotonic()
+        if not self.logBuffer:
+            return
+        self.ui.statusLabel.appendPlainText("\n".join(self.logBuffer))
+        self.logBuffer = []
+        if self.lastLogFlushTime - self.lastProcessEventsTime >= self.processEventsInterval:
+            self.lastProcessEventsTime = self.lastLogFlushTime
+            slicer.app.processEvents()
 
 class InstallError(Exception):
     def __init__(self, message):
@@ -718,7 +803,14 @@ class TotalSpineSegLogic(ScriptedLoadableModuleLogic):
         self.clearOutputFolder = True
         self.totalSpineSegPythonPackageDownloadUrl = "https://github.com/neuropoly/totalspineseg/archive/refs/tags/r20251124.zip"
         self.processRunner = None
+        # Output decoder and unfinished last line of the running QProcess
+        self.processOutputDecoder = None
+        self.processOutputTail = None
         self.processingFinishedCallback = None
+        self._pythonSlicerExecutablePath = None
+        # Missing dependencies found by the last check, None if not checked yet in this session
+        self._missingDependencies = None
+        self._packageInfoCache = None
 
     def log(self, text):
         logging.info(text)
@@ -730,35 +822,69 @@ class TotalSpineSegLogic(ScriptedLoadableModuleLogic):
             parameterNode.SetParameter("UseStandardSegmentNames", "true")
 
     def installedTotalSpineSegPythonPackageDownloadUrl(self):
-        import importlib.metadata
         import json
         try:
-            metadataPath = [p for p in importlib.metadata.files('totalspineseg') if 'direct_url.json' in str(p)][0]
-            with open(metadataPath.locate()) as json_file:
-                data = json.load(json_file)
-            return data['url']
+            # Read direct_url.json from the distribution metadata folder instead of scanning the installed file list
+            directUrl = importlib.metadata.distribution('totalspineseg').read_text('direct_url.json')
+            if not directUrl:
+                return None
+            return json.loads(directUrl)['url']
         except:
             return None
 
+    def pythonSlicerExecutablePath(self):
+        # Resolve once, shutil.which stats every PATH entry on each call
+        if not self._pythonSlicerExecutablePath:
+            import shutil
+            self._pythonSlicerExecutablePath = shutil.which('PythonSlicer')
+        return self._pythonSlicerExecutablePath
+
     def installedTotalSpineSegPythonPackageInfo(self):
-        import shutil
-        import subprocess
-        versionInfo = subprocess.check_output([shutil.which('PythonSlicer'), "-m", "pip", "show", "totalspineseg"]).decode()
+        # The installed package only changes through installPackages, which clears this cache
+        if self._packageInfoCache is not None:
+            return self._packageInfoCache
+        # Read the installed metadata in-process instead of starting a "pip show" subprocess
+        distribution = importlib.metadata.distribution('totalspineseg')
+        metadata = distribution.metadata
+        versionInfo = ""
+        for field in ["Name", "Version", "Summary", "Home-page", "Author", "Author-email", "License"]:
+            versionInfo += f"{field}: {metadata.get(field) or ''}\n"
+        versionInfo += f"Location: {distribution.locate_file('')}\n"
+        # Names of the install requirements, without the ones that are only pulled in by extras (as "pip show" lists them)
+        requires = set()
+        for requirement in distribution.requires or []:
+            requirement, _sep, marker = requirement.partition(";")
+            if _EXTRA_MARKER_RE.search(marker):
+                continue
+            match = _REQUIREMENT_NAME_RE.match(requirement.strip())
+            if match:
+                requires.add(match.group())
+        versionInfo += f"Requires: {', '.join(sorted(requires, key=str.lower))}\n"
         downloadUrl = self.installedTotalSpineSegPythonPackageDownloadUrl()
         if downloadUrl:
             versionInfo += "Download URL: " + downloadUrl
+        self._packageInfoCache = versionInfo
         return versionInfo
 
+    def dependenciesChecked(self):
+        return self._missingDependencies is not None
+
     def checkDependencies(self, force=False):
-        import importlib
-        importlib.invalidate_caches()
-        from packaging.requirements import Requirement
+        # The result only changes through installPackages (which clears it) or a restart, so probe once per session
+        if not force and self._missingDependencies is not None:
+            return list(self._missingDependencies)
 
+        import sys
         settings = slicer.app.userSettings()
-        settingsKey = "TotalSpineSeg/DependencyCheckPassed"
-        if not force and settings.value(settingsKey) == "true":
+        settingsKey = "TotalSpineSeg/DependencyFingerprint"
+        # A passed check is only trusted for the same Slicer build and Python version
+        fingerprint = f"{slicer.app.revision}-py{sys.version_info.major}.{sys.version_info.minor}"
+        if not force and settings.value(settingsKey) == fingerprint:
+            self._missingDependencies = []
             return []
 
+        importlib.invalidate_caches()
+
         missingPackages = []
         em = slicer.app.extensionsManagerModel()
 
@@ -781,6 +907,7 @@ class TotalSpineSegLogic(ScriptedLoadableModuleLogic):
         else:
             try:
                 import SlicerNNUNetLib
+                from packaging.requirements import Requirement
                 nnunetlogic = SlicerNNUNetLib.InstallLogic(doAskConfirmation=False)
                 if not nnunetlogic.isPackageInstalled(Requirement("nnunetv2")):
                     missingPackages.append("nnunetv2")
@@ -788,30 +915,22 @@ class TotalSpineSegLogic(ScriptedLoadableModuleLogic):
                 missingPackages.append("NNUNet")
 
         # 2. Python packages
-        try:
-            import pandas
-        except ImportError:
-            missingPackages.append("pandas")
-        
-        try:
-            import dicom2nifti
-        except ImportError:
-            missingPackages.append("dicom2nifti")
-
-        try:
-            import totalspineseg
-        except ImportError:
-            missingPackages.append("totalspineseg")
+        # Only locate the packages, importing them (pandas in particular) runs their whole initialization
+        for packageName in ["pandas", "dicom2nifti", "totalspineseg"]:
+            if importlib.util.find_spec(packageName) is None:
+                missingPackages.append(packageName)
 
         if not missingPackages:
-            settings.setValue(settingsKey, "true")
+            settings.setValue(settingsKey, fingerprint)
         else:
-            settings.setValue(settingsKey, "false")
+            settings.remove(settingsKey)
 
-        return list(set(missingPackages))
+        # Drop duplicates but keep the check order, so the missing list reads the same every time
+        self._missingDependencies = list(dict.fromkeys(missingPackages))
+        return list(self._missingDependencies)
 
     def installPackages(self, packages):
-        import importlib
+        self._missingDependencies = None
         em = slicer.app.extensionsManagerModel()
         
         restartNeeded = False
@@ -847,34 +966,53 @@ class TotalSpineSegLogic(ScriptedLoadableModuleLogic):
             return True
 
         # Python packages
+        # Collected into a single pip call so pip starts and resolves dependencies only once
+        requirements = []
         if "pandas" in packages:
-            slicer.util.pip_install("pandas")
+            requirements.append("pandas")
         if "dicom2nifti" in packages:
             # Use specific version known to work with Slicer if needed, or just standard
-            slicer.util.pip_install("dicom2nifti<=2.5.1")
+            requirements.append("dicom2nifti<=2.5.1")
         
         # PyTorch logic handled above, but if we are here, restart was not deemed needed yet.
         # If PyTorch was in packages, we might have installed torch libs.
         
         if "nnunetv2" in packages:
-            slicer.util.pip_install("nnunetv2")
+            requirements.append("nnunetv2")
 
         if "totalspineseg" in packages:
-            slicer.util.pip_install(self.totalSpineSegPythonPackageDownloadUrl)
+            requirements.append(self.totalSpineSegPythonPackageDownloadUrl)
+
+        if requirements:
+            self._packageInfoCache = None
+            slicer.util.pip_install(requirements)
 
         return False
 
+    def splitOutputLines(self, text):
+        # A trailing '\r' may be the first half of a '\r\n' that continues in the next block
+        hold = "\r" if text.endswith("\r") else ""
+        lines = _NEWLINE_RE.split(text[:len(text) - len(hold)])
+        return lines, lines.pop() + hold
+
     def logProcessOutput(self, proc):
-        output = ""
+        import codecs
         from subprocess import CalledProcessError
+        # Read all output that is available at once and log it with a single call,
+        # instead of one log call (and GUI update) per line.
+        # Undecodable bytes are replaced instead of dropping the line.
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        tail = ""
         while True:
-            try:
-                line = proc.stdout.readline()
-                if not line:
-                    break
-                self.log(line.rstrip())
-            except UnicodeDecodeError:
-                pass
+            chunk = proc.stdout.buffer.read1(65536)
+            text = tail + decoder.decode(chunk, final=not chunk)
+            if not chunk:
+                break
+            lines, tail = self.splitOutputLines(text)
+            if lines:
+                self.log("\n".join(line.rstrip() for line in lines))
+        if text.strip():
+            self.log(text.rstrip())
         proc.wait()
         if proc.returncode != 0:
             raise CalledProcessError(proc.returncode, proc.args, output=proc.stdout, stderr=proc.stderr)
@@ -883,184 +1021,176 @@ class TotalSpineSegLogic(ScriptedLoadableModuleLogic):
         if not inputVolume:
             raise ValueError("Input volume is invalid")
 
-        import time
         startTime = time.time()
         
-        import shutil
         tempFolder = slicer.util.tempDirectory()
         inputFile = os.path.join(tempFolder, "input.nii")
         outputFolder = os.path.join(tempFolder, "output")
-        os.makedirs(outputFolder, exist_ok=True)
+        # Do not leave the input and partial outputs behind if writing the inputs or starting inference fails
+        try:
+            os.makedirs(outputFolder, exist_ok=True)
 
-        self.log(_("Writing input file to {input_file}").format(input_file=inputFile))
-        slicer.util.saveNode(inputVolume, inputFile)
+            self.log(_("Writing input file to {input_file}").format(input_file=inputFile))
+            slicer.util.saveNode(inputVolume, inputFile)
 
-        pythonSlicerExecutablePath = shutil.which('PythonSlicer')
-        if not pythonSlicerExecutablePath:
-             raise RuntimeError("Python was not found")
+            pythonSlicerExecutablePath = self.pythonSlicerExecutablePath()
+            if not pythonSlicerExecutablePath:
+                 raise RuntimeError("Python was not found")
 
-        cmd = [pythonSlicerExecutablePath, "-m", "totalspineseg.inference", inputFile, outputFolder]
+            cmd = [pythonSlicerExecutablePath, "-m", "totalspineseg.inference", inputFile, outputFolder]
         
-        if inputLocalizer:
-            inputLocalizerFile = os.path.join(tempFolder, "localizer.nii.gz")
-            self.log(_("Writing localizer file to {localizer_file}").format(localizer_file=inputLocalizerFile))
-            
-            mapping = self.getTerminologyMapping()
-            reverseMapping = {v: k for k, v in mapping.items()}
+            if inputLocalizer:
+                reverseMapping = _TERMINOLOGY_REVERSE_MAPPING
             
-            segmentationNode = inputLocalizer
-            segmentation = segmentationNode.GetSegmentation()
+                segmentationNode = inputLocalizer
+                segmentation = segmentationNode.GetSegmentation()
             
-            labelmapNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLLabelMapVolumeNode")
-            if inputVolume:
-                labelmapNode.CopyOrientation(inputVolume)
-                labelmapNode.SetOrigin(inputVolume.GetOrigin())
-                labelmapNode.SetSpacing(inputVolume.GetSpacing())
-            
-            tempSegNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLSegmentationNode")
-            if segmentationNode.GetTransformNodeID():
-                tempSegNode.SetAndObserveTransformNodeID(segmentationNode.GetTransformNodeID())
-            
-            validSegments = []
-            for i in range(segmentation.GetNumberOfSegments()):
-                segId = segmentation.GetNthSegmentID(i)
-                segment = segmentation.GetSegment(segId)
-                name = segment.GetName()
+                validSegments = []
+                for i in range(segmentation.GetNumberOfSegments()):
+                    segId = segmentation.GetNthSegmentID(i)
+                    segment = segmentation.GetSegment(segId)
+                    name = segment.GetName()
                 
-                val = None
-                if name in reverseMapping:
-                    val = reverseMapping[name]
-                else:
-                    try:
+                    val = reverseMapping.get(name)
+                    if val is None and name.isdecimal():
                         val = int(name)
-                    except ValueError:
-                        pass
                 
-                if val is not None:
-                    newSegment = slicer.vtkSegment()
-                    newSegment.DeepCopy(segment)
-                    tempSegNode.GetSegmentation().AddSegment(newSegment)
-                    newSegId = tempSegNode.GetSegmentation().GetSegmentIdBySegment(newSegment)
-                    validSegments.append((newSegId, val))
-
-            slicer.modules.segmentations.logic().ExportSegmentsToLabelmapNode(tempSegNode, [], labelmapNode, inputVolume)
-            image = labelmapNode.GetImageData()
-            
-            if not image:
-                slicer.modules.segmentations.logic().ExportSegmentsToLabelmapNode(tempSegNode, [], labelmapNode)
-                image = labelmapNode.GetImageData()
+                    if val is not None:
+                        validSegments.append((segId, val))
 
-            if image:
-                image.GetPointData().GetScalars().FillComponent(0, 0)
-                import vtk.util.numpy_support as vtk_np
-                
-                acc_array = vtk_np.vtk_to_numpy(image.GetPointData().GetScalars())
-                
-                for segId, val in validSegments:
-                    tempLabel = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLLabelMapVolumeNode")
-                    slicer.modules.segmentations.logic().ExportSegmentsToLabelmapNode(tempSegNode, [segId], tempLabel, labelmapNode)
-                    
-                    temp_image = tempLabel.GetImageData()
-                    if temp_image:
-                        temp_array = vtk_np.vtk_to_numpy(temp_image.GetPointData().GetScalars())
-                        acc_array[temp_array > 0] = val
-                    
-                    slicer.mrmlScene.RemoveNode(tempLabel)
-                
-                image.Modified()
+                if not validSegments:
+                    # An all-zero localizer carries no information, skip the export and the file write
+                    self.log(_("Localizer has no segments with TotalSpineSeg names or label values, it is not used"))
+                else:
+                    inputLocalizerFile = os.path.join(tempFolder, "localizer.nii.gz")
+                    self.log(_("Writing localizer file to {localizer_file}").format(localizer_file=inputLocalizerFile))
             
-            slicer.util.saveNode(labelmapNode, inputLocalizerFile)
-            slicer.mrmlScene.RemoveNode(labelmapNode)
-            slicer.mrmlScene.RemoveNode(tempSegNode)
+                    labelmapNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLLabelMapVolumeNode")
+                    if inputVolume:
+                        labelmapNode.CopyOrientation(inputVolume)
+                        labelmapNode.SetOrigin(inputVolume.GetOrigin())
+                        labelmapNode.SetSpacing(inputVolume.GetSpacing())
+
+                    # Export all valid segments in one pass, each one gets its position in the list + 1 as label value.
+                    # The segments are exported straight from the localizer, which also applies its parent transform.
+                    # The input volume is the reference geometry, unless it has no image data to take it from.
+                    segmentIds = [segId for segId, val in validSegments]
+                    exportArgs = [segmentationNode, segmentIds, labelmapNode]
+                    if inputVolume.GetImageData():
+                        exportArgs.append(inputVolume)
+                    slicer.modules.segmentations.logic().ExportSegmentsToLabelmapNode(*exportArgs)
+                    image = labelmapNode.GetImageData()
+
+                    if image:
+                        import numpy as np
+                        # Map the exported label values to the TotalSpineSeg label values with a single lookup
+                        labelValues = [0] + [val for segId, val in validSegments]
+                        labelArray = slicer.util.arrayFromVolume(labelmapNode)
+                        dtypeInfo = np.iinfo(labelArray.dtype)
+                        if dtypeInfo.min <= min(labelValues) and max(labelValues) <= dtypeInfo.max:
+                            # Write the remapped values back into the volume buffer, keeping its scalar type
+                            labelArray[...] = np.array(labelValues, dtype=labelArray.dtype)[labelArray]
+                            slicer.util.arrayFromVolumeModified(labelmapNode)
+                        else:
+                            slicer.util.updateVolumeFromArray(labelmapNode, np.array(labelValues, dtype=np.int16)[labelArray])
             
-            cmd.extend(["--loc", inputLocalizerFile])
+                    slicer.util.saveNode(labelmapNode, inputLocalizerFile)
+                    slicer.mrmlScene.RemoveNode(labelmapNode)
+            
+                    cmd.extend(["--loc", inputLocalizerFile])
 
-        if cpu:
-            cmd.extend(["--device", "cpu"])
-        if iso:
-            cmd.append("--iso")
+            if cpu:
+                cmd.extend(["--device", "cpu"])
+            if iso:
+                cmd.append("--iso")
             
-        if outputStep2 is None:
-            cmd.append("--step1")
+            if outputStep2 is None:
+                cmd.append("--step1")
             
-        keep_only = []
-        if outputStep1:
-            keep_only.append('step1_output')
-        if outputStep2:
-            keep_only.append('step2_output')
-        if outputCord:
-            keep_only.append('step1_cord')
-        if outputCanal:
-            keep_only.append('step1_canal')
-        if outputLevels:
-            keep_only.append('step1_levels')
+            keep_only = [folderName for outputNode, folderName in [
+                (outputStep1, 'step1_output'), (outputStep2, 'step2_output'), (outputCord, 'step1_cord'),
+                (outputCanal, 'step1_canal'), (outputLevels, 'step1_levels')] if outputNode]
             
-        if keep_only:
-            cmd.append("--keep-only")
-            cmd.extend(keep_only)
+            if keep_only:
+                cmd += ["--keep-only", *keep_only]
 
-        self.log(_('Running TotalSpineSeg AI...'))
-        self.log(f"Command: {cmd}")
+            self.log(_('Running TotalSpineSeg AI...'))
+            self.log(f"Command: {cmd}")
 
-        if waitForCompletion:
-            proc = slicer.util.launchConsoleProcess(cmd)
-            self.logProcessOutput(proc)
-            self.onProcessFinished(0, outputStep1, outputStep2, outputCord, outputCanal, outputLevels, useStandardNames, tempFolder, startTime, outputFolder)
-        else:
-            self.processRunner = qt.QProcess()
-            env = qt.QProcessEnvironment.systemEnvironment()
-            startupEnv = slicer.util.startupEnvironment()
-            for key, value in startupEnv.items():
-                env.insert(key, value)
-            self.processRunner.setProcessEnvironment(env)
+            if waitForCompletion:
+                proc = slicer.util.launchConsoleProcess(cmd)
+                self.logProcessOutput(proc)
+                self.onProcessFinished(0, outputStep1, outputStep2, outputCord, outputCanal, outputLevels, useStandardNames, tempFolder, startTime, outputFolder)
+            else:
+                self.processRunner = qt.QProcess()
+                env = qt.QProcessEnvironment.systemEnvironment()
+                startupEnv = slicer.util.startupEnvironment()
+                for key, value in startupEnv.items():
+                    env.insert(key, value)
+                self.processRunner.setProcessEnvironment(env)
+                # Errors are interleaved with the regular output, like in launchConsoleProcess, so only one pipe is drained
+                self.processRunner.setProcessChannelMode(qt.QProcess.MergedChannels)
+                import codecs
+                self.processOutputDecoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+                self.processOutputTail = ""
             
-            self.processRunner.connect('readyReadStandardOutput()', self.onProcessOutput)
-            self.processRunner.connect('readyReadStandardError()', self.onProcessOutput)
-            self.processRunner.connect('finished(int, QProcess::ExitStatus)', lambda exitCode, exitStatus: self.onProcessFinished(
-                exitCode, outputStep1, outputStep2, outputCord, outputCanal, outputLevels, useStandardNames, tempFolder, startTime, outputFolder))
+                self.processRunner.connect('readyReadStandardOutput()', self.onProcessOutput)
+                self.processRunner.connect('finished(int, QProcess::ExitStatus)', lambda exitCode, exitStatus: self.onProcessFinished(
+                    exitCode, outputStep1, outputStep2, outputCord, outputCanal, outputLevels, useStandardNames, tempFolder, startTime, outputFolder))
             
-            self.processRunner.start(cmd[0], cmd[1:])
+                self.processRunner.start(cmd[0], cmd[1:])
+        except Exception:
+            self.removeTempFolder(tempFolder)
+            raise
 
-    def onProcessOutput(self):
-        if not self.processRunner:
+    def onProcessOutput(self, final=False):
+        if not self.processRunner or self.processOutputTail is None:
             return
-        self.processRunner.setReadChannel(qt.QProcess.StandardOutput)
-        while self.processRunner.canReadLine():
-            self.log(self.processRunner.readLine().data().decode('utf-8').rstrip())
-        self.processRunner.setReadChannel(qt.QProcess.StandardError)
-        while self.processRunner.canReadLine():
-            self.log(self.processRunner.readLine().data().decode('utf-8').rstrip())
+        # Take everything that is buffered at once and log the complete lines with a single call
+        text = self.processOutputTail + self.processOutputDecoder.decode(self.processRunner.readAllStandardOutput().data(), final=final)
+        lines, self.processOutputTail = self.splitOutputLines(text)
+        if final and self.processOutputTail.strip():
+            lines.append(self.processOutputTail)
+        if lines:
+            self.log("\n".join(line.rstrip() for line in lines))
 
     def onProcessFinished(self, exitCode, outputStep1, outputStep2, outputCord, outputCanal, outputLevels, useStandardNames, tempFolder, startTime, outputFolder):
-        import time
+        if self.processOutputTail is not None:
+            # Log what is left of the output, including a last line without a newline
+            self.onProcessOutput(final=True)
+            self.processOutputDecoder = None
+            self.processOutputTail = None
         if exitCode != 0:
             self.log("Process failed with exit code " + str(exitCode))
+            self.removeTempFolder(tempFolder)
             if self.processingFinishedCallback:
                 self.processingFinishedCallback(False)
             return
 
         self.log(_('Importing results...'))
 
-        if outputStep1:
-            self.importResult(outputStep1, os.path.join(outputFolder, "step1_output"), "TotalSpineSeg_Step1", applyTerm=useStandardNames, renameSacrum=True)
-
-        if outputStep2:
-            self.importResult(outputStep2, os.path.join(outputFolder, "step2_output"), "TotalSpineSeg_Step2", applyTerm=useStandardNames, renameSacrum=True)
+        # Defer scene updates until all outputs are imported
+        slicer.mrmlScene.StartState(slicer.mrmlScene.BatchProcessState)
+        try:
+            if outputStep1:
+                self.importResult(outputStep1, os.path.join(outputFolder, "step1_output"), "TotalSpineSeg_Step1", applyTerm=useStandardNames, renameSacrum=True)
 
-        if outputCord:
-            self.importResult(outputCord, os.path.join(outputFolder, "step1_cord"), "TotalSpineSeg_Cord", isSoft=True, colorNodeID="vtkMRMLColorTableNodeGreen")
-            slicer.util.setSliceViewerLayers(foreground=outputCord, foregroundOpacity=1.0)
+            if outputStep2:
+                self.importResult(outputStep2, os.path.join(outputFolder, "step2_output"), "TotalSpineSeg_Step2", applyTerm=useStandardNames, renameSacrum=True)
 
-        if outputCanal:
-            self.importResult(outputCanal, os.path.join(outputFolder, "step1_canal"), "TotalSpineSeg_Canal", isSoft=True, colorNodeID="vtkMRMLColorTableNodeYellow")
-            slicer.util.setSliceViewerLayers(foreground=outputCanal, foregroundOpacity=1.0)
+            if outputCord:
+                self.importResult(outputCord, os.path.join(outputFolder, "step1_cord"), "TotalSpineSeg_Cord", isSoft=True, colorNodeID="vtkMRMLColorTableNodeGreen")
+                slicer.util.setSliceViewerLayers(foreground=outputCord, foregroundOpacity=1.0)
 
-        if outputLevels:
-            self.importResult(outputLevels, os.path.join(outputFolder, "step1_levels"), "TotalSpineSeg_Levels")
+            if outputCanal:
+                self.importResult(outputCanal, os.path.join(outputFolder, "step1_canal"), "TotalSpineSeg_Canal", isSoft=True, colorNodeID="vtkMRMLColorTableNodeYellow")
+                slicer.util.setSliceViewerLayers(foreground=outputCanal, foregroundOpacity=1.0)
 
-        if self.clearOutputFolder:
-            import shutil
-            shutil.rmtree(tempFolder)
+            if outputLevels:
+                self.importResult(outputLevels, os.path.join(outputFolder, "step1_levels"), "TotalSpineSeg_Levels")
+        finally:
+            slicer.mrmlScene.EndState(slicer.mrmlScene.BatchProcessState)
+            self.removeTempFolder(tempFolder)
             
         stopTime = time.time()
         self.log(_("Processing completed in {time:.2f}s").format(time=stopTime-startTime))
@@ -1068,26 +1198,39 @@ class TotalSpineSegLogic(ScriptedLoadableModuleLogic):
         if self.processingFinishedCallback:
             self.processingFinishedCallback(True)
 
+    def removeTempFolder(self, tempFolder):
+        if self.clearOutputFolder:
+            import shutil
+            # Cleanup must not hide the actual result or error, e.g. when a file is still open on Windows
+            shutil.rmtree(tempFolder, ignore_errors=True)
+
     def importResult(self, node, folder, prefix, isSoft=False, applyTerm=False, colorNodeID=None, renameSacrum=False):
-        import glob
         if not os.path.exists(folder):
             self.log(f"Folder {folder} not found.")
             return
             
-        files = glob.glob(os.path.join(folder, "*.nii.gz")) + glob.glob(os.path.join(folder, "*.nii"))
-        if not files:
+        # Single directory pass, a .nii.gz file is preferred over a .nii file
+        path = None
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                if entry.name.endswith(".nii.gz"):
+                    path = entry.path
+                    break
+                if entry.name.endswith(".nii") and path is None:
+                    path = entry.path
+        if not path:
             return
             
-        path = files[0]
         self.log(f"Importing {path} to {node.GetName()}")
         
         if isSoft:
-            tempNode = slicer.util.loadVolume(path, {"show": False})
-            if tempNode:
-                node.SetAndObserveImageData(tempNode.GetImageData())
-                node.CopyOrientation(tempNode)
-                slicer.mrmlScene.RemoveNode(tempNode)
-                
+            # Read the file directly into the output node, without adding a temporary volume to the scene
+            storageNode = slicer.vtkMRMLVolumeArchetypeStorageNode()
+            storageNode.SetFileName(path)
+            storageNode.SetSingleFile(True)
+            if storageNode.ReadData(node):
                 displayNode = node.GetDisplayNode()
                 if not displayNode:
                     node.CreateDefaultDisplayNodes()
@@ -1119,47 +1262,42 @@ class TotalSpineSegLogic(ScriptedLoadableModuleLogic):
                             s.SetName("Vertebrae")
 
     def getTerminologyMapping(self):
-        return {
-            1: "spinal_cord", 2: "spinal_canal", 3: "vertebrae_L5", 
-            11: "vertebrae_C1", 12: "vertebrae_C2", 13: "vertebrae_C3", 14: "vertebrae_C4", 15: "vertebrae_C5", 16: "vertebrae_C6", 17: "vertebrae_C7",
-            21: "vertebrae_T1", 22: "vertebrae_T2", 23: "vertebrae_T3", 24: "vertebrae_T4", 25: "vertebrae_T5", 26: "vertebrae_T6", 27: "vertebrae_T7", 28: "vertebrae_T8", 29: "vertebrae_T9", 30: "vertebrae_T10", 31: "vertebrae_T11", 32: "vertebrae_T12",
-            41: "vertebrae_L1", 42: "vertebrae_L2", 43: "vertebrae_L3", 44: "vertebrae_L4", 45: "vertebrae_L5", 46: "vertebrae_L6",
-            50: "sacrum",
-            63: "disc_C2_C3", 64: "disc_C3_C4", 65: "disc_C4_C5", 66: "disc_C5_C6", 67: "disc_C6_C7", 70: "disc_C7_T1", 
-            71: "disc_T1_T2", 72: "disc_T2_T3", 73: "disc_T3_T4", 74: "disc_T4_T5", 75: "disc_T5_T6", 76: "disc_T6_T7", 77: "disc_T7_T8", 78: "disc_T8_T9", 79: "disc_T9_T10", 80: "disc_T10_T11", 81: "disc_T11_T12",
-            91: "disc_T12_L1", 92: "disc_L1_L2", 93: "disc_L2_L3", 94: "disc_L3_L4", 95: "disc_L4_L5", 100: "disc_L5_S1"
-        }
+        return _TERMINOLOGY_MAPPING
 
     def applyTotalSpineSegTerminology(self, node, renameSacrumToVertebrae=False):
         segmentation = node.GetSegmentation()
         mapping = self.getTerminologyMapping()
         # Avoid renaming if already in mapping values to prevent misinterpretation (e.g. C1 -> 1 -> spinal_cord)
-        known_names = set(mapping.values())
+        known_names = _TERMINOLOGY_REVERSE_MAPPING
         
-        for i in range(segmentation.GetNumberOfSegments()):
-            segmentId = segmentation.GetNthSegmentID(i)
-            segment = segmentation.GetSegment(segmentId)
-            segmentName = segment.GetName()
+        # Rename all segments in one modification, so observers (segment list, views) update once
+        wasModifying = node.StartModify()
+        try:
+            # All segment IDs in one call instead of one wrapped call per index
+            for segmentId in segmentation.GetSegmentIDs():
+                segment = segmentation.GetSegment(segmentId)
+                segmentName = segment.GetName()
             
-            if segmentName in known_names:
-                if renameSacrumToVertebrae and segmentName == "sacrum":
-                    segment.SetName("Vertebrae")
-                continue
+                if segmentName in known_names:
+                    if renameSacrumToVertebrae and segmentName == "sacrum":
+                        segment.SetName("Vertebrae")
+                    continue
                 
-            labelValue = None
-            try:
-                labelValue = int(segmentName)
-            except ValueError:
-                import re
-                numbers = re.findall(r'\d+', segmentName)
-                if numbers:
-                    labelValue = int(numbers[-1])
+                labelValue = None
+                if segmentName.isdecimal():
+                    labelValue = int(segmentName)
+                else:
+                    numbers = _DIGITS_RE.findall(segmentName)
+                    if numbers:
+                        labelValue = int(numbers[-1])
             
-            if labelValue is not None and labelValue in mapping:
-                newName = mapping[labelValue]
-                if renameSacrumToVertebrae and newName == "sacrum":
-                    newName = "Vertebrae"
-                segment.SetName(newName)
+                newName = mapping.get(labelValue)
+                if newName:
+                    if renameSacrumToVertebrae and newName == "sacrum":
+                        newName = "Vertebrae"
+                    segment.SetName(newName)
+        finally:
+            node.EndModify(wasModifying)
 
 
 class TotalSpineSegTest(ScriptedLoadableModuleTest):